@@ -14,16 +14,26 @@ request rates (1,000+ RPM). All CPU‑bound work and Firestore writes happen
 in the Pub/Sub worker.
 """
 
-import json
+import functools
+import logging
 import os
-import uuid
 from typing import Any, Dict, Tuple
 
+import msgspec
 from google.cloud import pubsub_v1
+from google.cloud.pubsub_v1.publisher.exceptions import MessageTooLargeError
+from ulid import ULID
 
 
+logger = logging.getLogger(__name__)
+
 _publisher: pubsub_v1.PublisherClient | None = None
 
+# Pub/Sub rejects publish requests over 10,000,000 bytes, counting the topic,
+# attributes and framing as well as the data, so leave headroom below that.
+_MAX_BODY_BYTES = 9_500_000
+_READ_CHUNK_BYTES = 64 * 1024
+
 
 class BadRequest(Exception):
     def __init__(self, message: str, status_code: int = 400) -> None:
@@ -32,9 +42,22 @@ class BadRequest(Exception):
         self.status_code = status_code
 
 
+class Normalized(msgspec.Struct):
+    """Internal representation shared by the JSON and text normalizers."""
+
+    tenant_id: str
+    log_id: str
+    text_bytes: bytes
+    source: str
+
+
 def _get_publisher() -> pubsub_v1.PublisherClient:
     global _publisher
     if _publisher is None:
+        # The client's default batching (100 messages / 1 MB / 10 ms) already shares
+        # publish RPCs across concurrent requests. A longer latency window would
+        # only hold fire-and-forget messages back once CPU is throttled after the
+        # response, so the defaults are kept deliberately.
         _publisher = pubsub_v1.PublisherClient()
     return _publisher
 
@@ -46,7 +69,10 @@ def _get_project_id() -> str:
     return project_id
 
 
+@functools.lru_cache(maxsize=1)
 def _get_topic_path() -> str:
+    # Environment and project are fixed for the lifetime of the instance, so the
+    # path is resolved once. Failures are not cached and will be retried.
     topic_id = os.environ.get("PUBSUB_TOPIC")
     if not topic_id:
         raise RuntimeError("PUBSUB_TOPIC environment variable must be set")
@@ -55,23 +81,54 @@ def _get_topic_path() -> str:
     return publisher.topic_path(project_id, topic_id)
 
 
-def _normalize_json(request) -> Dict[str, Any]:
+def _read_body(request) -> bytes:
+    """
+    Read the request body, rejecting anything over `_MAX_BODY_BYTES` with 413.
+
+    A declared Content-Length is checked before reading anything. Chunked
+    uploads (no Content-Length) are read in bounded chunks so an oversized body
+    is rejected without first being buffered in full.
+    """
+    content_length = request.content_length
+    if content_length is not None:
+        if content_length > _MAX_BODY_BYTES:
+            raise BadRequest("Request body too large", 413)
+        return request.get_data()
+
+    chunks = []
+    size = 0
+    while True:
+        chunk = request.stream.read(_READ_CHUNK_BYTES)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > _MAX_BODY_BYTES:
+            raise BadRequest("Request body too large", 413)
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def _normalize_json(raw: bytes, request) -> Normalized:
     """
     Normalize a JSON payload into the internal representation.
 
     Expected JSON body:
         {
           "tenant_id": "acme",
-          "log_id": "optional-id",  # optional, UUID generated if omitted
+          "log_id": "optional-id",  # optional, ULID generated if omitted
           "text": "User 555-0199 accessed..."
         }
     """
-    data = request.get_json(silent=True)
-    if data is None:
+    # Parse with msgspec rather than Flask's get_json(), which goes through stdlib json.
+    try:
+        data = msgspec.json.decode(raw) if raw else None
+    except (msgspec.DecodeError, UnicodeDecodeError):
+        raise BadRequest("Invalid JSON body")
+    if not isinstance(data, dict):
         raise BadRequest("Invalid JSON body")
 
     tenant_id = data.get("tenant_id")
-    log_id = data.get("log_id") or str(uuid.uuid4())
+    log_id = data.get("log_id") or str(ULID())
     text = data.get("text")
 
     if not tenant_id or not isinstance(tenant_id, str):
@@ -79,15 +136,15 @@ def _normalize_json(request) -> Dict[str, Any]:
     if not text or not isinstance(text, str):
         raise BadRequest("Field 'text' is required and must be a string")
 
-    return {
-        "tenant_id": tenant_id,
-        "log_id": log_id,
-        "text": text,
-        "source": "json_upload",
-    }
+    return Normalized(
+        tenant_id=tenant_id,
+        log_id=log_id,
+        text_bytes=text.encode("utf-8"),
+        source="json_upload",
+    )
 
 
-def _normalize_text(request) -> Dict[str, Any]:
+def _normalize_text(raw: bytes, request) -> Normalized:
     """
     Normalize a raw text payload into the internal representation.
 
@@ -100,43 +157,62 @@ def _normalize_text(request) -> Dict[str, Any]:
     if not tenant_id:
         raise BadRequest("Header 'X-Tenant-ID' is required for text/plain payloads")
 
+    # The body is published as-is; decode only to reject invalid UTF-8 up front,
+    # without keeping a decoded copy of a potentially large payload alive.
     try:
-        body_bytes = request.get_data(cache=False)  # type: ignore[call-arg]
-    except TypeError:
-        # For older function runtimes where get_data() has no cache parameter
-        body_bytes = request.get_data()
+        raw.decode("utf-8")
+    except UnicodeDecodeError:
+        raise BadRequest("Body must be valid UTF-8 text")
+    log_id = str(ULID())
+
+    return Normalized(
+        tenant_id=tenant_id,
+        log_id=log_id,
+        text_bytes=raw,
+        source="text_upload",
+    )
+
 
-    text = body_bytes.decode("utf-8")
-    log_id = str(uuid.uuid4())
+# Media type (without parameters such as `; charset=utf-8`) -> normalizer.
+_NORMALIZERS = {
+    "application/json": _normalize_json,
+    "text/plain": _normalize_text,
+}
 
-    return {
-        "tenant_id": tenant_id,
-        "log_id": log_id,
-        "text": text,
-        "source": "text_upload",
-    }
 
+def _log_publish_failure(future) -> None:
+    exc = future.exception()
+    if exc is not None:
+        logger.error("Pub/Sub publish failed: %s", exc)
 
-def _publish(normalized: Dict[str, Any]) -> None:
+
+def _publish(normalized: Normalized) -> None:
     publisher = _get_publisher()
     topic_path = _get_topic_path()
 
     # Unified internal, flat text format:
-    # - Message data: raw text (string) from either JSON or text upload.
+    # - Message data: UTF-8 text from either JSON or text upload.
     # - Attributes: minimal metadata for downstream processing
     #   (tenant isolation and idempotent keys are handled by the worker).
-    data_bytes = normalized["text"].encode("utf-8")
-    publisher.publish(
-        topic_path,
-        data=data_bytes,
-        tenant_id=normalized["tenant_id"],
-        log_id=normalized["log_id"],
-        source=normalized["source"],
-    )
+    try:
+        future = publisher.publish(
+            topic_path,
+            data=normalized.text_bytes,
+            tenant_id=normalized.tenant_id,
+            log_id=normalized.log_id,
+            source=normalized.source,
+        )
+    except MessageTooLargeError:
+        # Body plus attributes still exceeded the Pub/Sub request limit.
+        raise BadRequest("Request body too large", 413)
+    # publish() only enqueues the message; the batcher sends it from a background
+    # thread. Report failures from there instead of blocking this request on it.
+    future.add_done_callback(_log_publish_failure)
 
 
-def _make_response(body: Dict[str, Any], status_code: int) -> Tuple[str, int, Dict[str, str]]:
-    return json.dumps(body), status_code, {"Content-Type": "application/json"}
+def _make_response(body: Dict[str, Any], status_code: int) -> Tuple[bytes, int, Dict[str, str]]:
+    # msgspec returns UTF-8 bytes directly, so the WSGI layer does not re-encode a str.
+    return msgspec.json.encode(body), status_code, {"Content-Type": "application/json"}
 
 
 def ingest(request):
@@ -145,6 +221,7 @@ def ingest(request):
 
     Behaviour:
       - Only allows POST requests (returns 405 for others).
+      - Rejects bodies larger than 9.5 MB (returns 413).
       - Dispatches based on Content-Type:
           * application/json → `_normalize_json`
           * text/plain      → `_normalize_text`
@@ -165,21 +242,22 @@ def ingest(request):
             return _make_response({"error": "Method not allowed"}, 405)
 
         content_type = request.headers.get("Content-Type", "") or ""
+        media_type = content_type.split(";", 1)[0].strip().lower()
 
-        if "application/json" in content_type:
-            normalized = _normalize_json(request)
-        elif "text/plain" in content_type:
-            normalized = _normalize_text(request)
-        else:
+        normalize = _NORMALIZERS.get(media_type)
+        if normalize is None:
             raise BadRequest("Unsupported Content-Type. Use application/json or text/plain.")
+        # Read the body exactly once and hand the same bytes to the normalizer.
+        raw = _read_body(request)
+        normalized = normalize(raw, request)
 
         _publish(normalized)
 
         return _make_response(
             {
                 "status": "accepted",
-                "tenant_id": normalized["tenant_id"],
-                "log_id": normalized["log_id"],
+                "tenant_id": normalized.tenant_id,
+                "log_id": normalized.log_id,
             },
             202,
         )